@@ -13,14 +13,23 @@ Notes:
 """
 
 import argparse
+import base64
+import http.client
 import json
+import sqlite3
 import sys
 import time
 import urllib.parse
 import urllib.request
-from typing import Any, Dict, List, Optional
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
 from urllib.error import HTTPError, URLError
 
+try:
+    import orjson
+except ImportError:  # optional; the standard library json module is used instead
+    orjson = None
+
 
 # Application metadata
 APP_NAME = "arrlist-generator"
@@ -29,38 +38,247 @@ APP_URL = "https://github.com/jtreveset/arrlist"
 DEFAULT_USER_AGENT = f"{APP_NAME}/{APP_VERSION} ({APP_URL})"
 
 MB_BASE_URL = "https://musicbrainz.org/ws/2/artist"
+# Only the top few candidates are needed to pick an exact name match; the
+# default page of 25 full artist records is mostly discarded.
+MB_SEARCH_LIMIT = 5
+
+DEFAULT_CACHE_DB = "mbid_cache.db"
+
+# Persistent HTTPS connection reused across lookups (keep-alive), so each
+# request does not pay for a fresh TCP + TLS handshake. _CONNECTION_KEY is the
+# (host, port) it was opened for, since through a proxy the connection's own
+# host is the proxy's.
+_CONNECTION: Optional[http.client.HTTPSConnection] = None
+_CONNECTION_KEY: Optional[Tuple[str, int]] = None
 
 
 def normalize_name(name: str) -> str:
     return " ".join(name.split()).strip().lower()
 
 
-def fetch_json(url: str, params: Optional[Dict[str, Any]], user_agent: str, timeout: int = 30):
+class AIMDState:
+    """
+    Additive-increase/multiplicative-decrease controller for the request interval.
+
+    Each successful request shortens the interval by `alpha` down to `floor`;
+    each throttled one (429/503) multiplies it by `beta` up to `ceil`. The
+    interval thus settles near the rate the server actually accepts.
+    """
+
+    def __init__(
+        self,
+        current: float = 1.1,
+        floor: float = 1.0,
+        ceil: float = 10.0,
+        alpha: float = 0.1,
+        beta: float = 2.0,
+    ):
+        self.current = current
+        self.floor = floor
+        self.ceil = ceil
+        self.alpha = alpha
+        self.beta = beta
+
+    def on_success(self):
+        self.current = max(self.floor, self.current - self.alpha)
+
+    def on_throttle(self):
+        self.current = min(self.ceil, self.current * self.beta)
+
+
+class RateLimiter:
+    """
+    Sliding-window request limiter that also reacts to rate-limit headers.
+
+    At most `max_requests` are issued per `period` seconds. On top of that,
+    a Retry-After header, or X-RateLimit-Remaining dropping below `threshold`,
+    pauses requests until the server says capacity is available again.
+
+    The period is driven by an AIMDState: by default it starts at, and never
+    drops below, the configured period, and widens while the server throttles.
+    """
+
+    def __init__(
+        self,
+        max_requests: int = 1,
+        period: float = 1.1,
+        threshold: int = 1,
+        backoff: Optional[AIMDState] = None,
+    ):
+        self.max_requests = max_requests
+        self.backoff = backoff or AIMDState(current=period, floor=period, ceil=max(10.0, period))
+        self.threshold = threshold
+        self.remaining: Optional[int] = None
+        self._sent: Deque[float] = deque()
+        self._not_before = 0.0
+
+    @property
+    def period(self) -> float:
+        return self.backoff.current
+
+    def on_success(self):
+        self.backoff.on_success()
+
+    def on_throttle(self):
+        self.backoff.on_throttle()
+
+    def wait(self):
+        """Block until another request may be sent, then record it."""
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= self.period:
+            self._sent.popleft()
+
+        wake = self._not_before
+        if len(self._sent) >= self.max_requests:
+            wake = max(wake, self._sent[0] + self.period)
+        if wake > now:
+            time.sleep(wake - now)
+
+        self._sent.append(time.monotonic())
+
+    def update(self, headers):
+        """Adjust the next allowed send time from response headers."""
+        if not headers:
+            return
+        now = time.monotonic()
+
+        ra = headers.get("Retry-After")
+        if ra:
+            try:
+                self._not_before = max(self._not_before, now + float(ra))
+            except ValueError:
+                pass
+
+        rem = headers.get("X-RateLimit-Remaining")
+        if rem is None:
+            return
+        try:
+            self.remaining = int(rem)
+        except ValueError:
+            return
+        if self.remaining >= self.threshold:
+            return
+
+        # X-RateLimit-Reset is a Unix timestamp; fall back to one period.
+        pause = self.period
+        reset = headers.get("X-RateLimit-Reset")
+        if reset:
+            try:
+                pause = max(0.0, float(reset) - time.time())
+            except ValueError:
+                pass
+        self._not_before = max(self._not_before, now + pause)
+
+
+def _get_connection(host: str, port: Optional[int], timeout: int) -> Tuple[http.client.HTTPSConnection, bool]:
+    """Return (connection, reused) for host, opening a new one if needed."""
+    global _CONNECTION, _CONNECTION_KEY
+    port = port or http.client.HTTPS_PORT
+    if _CONNECTION is not None and _CONNECTION_KEY == (host, port):
+        _CONNECTION.timeout = timeout
+        return _CONNECTION, True
+    _close_connection()
+
+    # Honour https_proxy/no_proxy like urlopen does, tunnelling with CONNECT.
+    proxy = urllib.request.getproxies().get("https")
+    if proxy and not urllib.request.proxy_bypass(host):
+        if "://" not in proxy:
+            proxy = f"http://{proxy}"
+        proxy_parts = urllib.parse.urlsplit(proxy)
+        tunnel_headers = {}
+        if proxy_parts.username:
+            credentials = (
+                f"{urllib.parse.unquote(proxy_parts.username)}:"
+                f"{urllib.parse.unquote(proxy_parts.password or '')}"
+            )
+            token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+            tunnel_headers["Proxy-Authorization"] = f"Basic {token}"
+        conn = http.client.HTTPSConnection(proxy_parts.hostname, proxy_parts.port, timeout=timeout)
+        conn.set_tunnel(host, port, headers=tunnel_headers)
+    else:
+        conn = http.client.HTTPSConnection(host, port, timeout=timeout)
+
+    _CONNECTION = conn
+    _CONNECTION_KEY = (host, port)
+    return _CONNECTION, False
+
+
+def _close_connection():
+    global _CONNECTION, _CONNECTION_KEY
+    if _CONNECTION is not None:
+        _CONNECTION.close()
+        _CONNECTION = None
+        _CONNECTION_KEY = None
+
+
+def fetch_json(
+    url: str,
+    params: Optional[Dict[str, Any]],
+    user_agent: str,
+    timeout: int = 30,
+    limiter: Optional[RateLimiter] = None,
+):
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or "/"
     if params:
         query_str = urllib.parse.urlencode(params)
-        url = f"{url}?{query_str}"
+        path = f"{path}?{query_str}"
     headers = {
         "User-Agent": user_agent,
         "Accept": "application/json",
     }
-    req = urllib.request.Request(url, headers=headers)
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        charset = resp.headers.get_content_charset() or "utf-8"
-        data = resp.read()
-        return json.loads(data.decode(charset)), resp.headers
 
+    if limiter is not None:
+        limiter.wait()
 
-def search_artist_mbid(name: str, user_agent: str, retries: int = 3, delay: float = 1.1) -> Optional[str]:
+    while True:
+        conn, reused = _get_connection(parts.hostname, parts.port, timeout)
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            break
+        except (OSError, http.client.HTTPException) as e:
+            _close_connection()
+            # The server may have dropped an idle keep-alive connection;
+            # retry once on a fresh one before reporting a network error.
+            if reused:
+                continue
+            raise URLError(e) from e
+
+    if resp.will_close:
+        _close_connection()
+    if limiter is not None:
+        limiter.update(resp.headers)
+    # Redirects are not followed; like any other non-2xx status they go
+    # through the HTTPError path instead of reaching the JSON parser.
+    if resp.status >= 300:
+        raise HTTPError(url, resp.status, resp.reason, resp.headers, None)
+    charset = resp.headers.get_content_charset() or "utf-8"
+    if orjson is not None and charset.lower() in ("utf-8", "utf8"):
+        return orjson.loads(data), resp.headers
+    return json.loads(data.decode(charset)), resp.headers
+
+
+def search_artist_mbid(
+    name: str,
+    user_agent: str,
+    retries: int = 3,
+    delay: float = 1.1,
+    limiter: Optional[RateLimiter] = None,
+) -> Optional[str]:
     # Use quoted phrase search on the artist field
     # Escape embedded quotes to keep a valid phrase query
     safe_name = name.replace('"', '\\"')
     query = f'artist:"{safe_name}"'
-    params = {"query": query, "fmt": "json"}
+    params = {"query": query, "fmt": "json", "limit": MB_SEARCH_LIMIT}
 
     attempt = 0
     while attempt <= retries:
         try:
-            data, headers = fetch_json(MB_BASE_URL, params=params, user_agent=user_agent)
+            data, headers = fetch_json(MB_BASE_URL, params=params, user_agent=user_agent, limiter=limiter)
+            if limiter is not None:
+                limiter.on_success()
             artists = data.get("artists") or []
             if not artists:
                 return None
@@ -89,8 +307,12 @@ def search_artist_mbid(name: str, user_agent: str, retries: int = 3, delay: floa
                         retry_after = None
 
             if e.code in (429, 503) or retry_after is not None:
-                wait = retry_after if retry_after is not None else (delay * (2 ** attempt))
-                time.sleep(wait)
+                if limiter is not None:
+                    # Widen the request interval; the limiter also holds the
+                    # next request back until Retry-After has elapsed.
+                    limiter.on_throttle()
+                else:
+                    time.sleep(retry_after if retry_after is not None else delay * (2 ** attempt))
                 attempt += 1
                 continue
 
@@ -106,6 +328,35 @@ def search_artist_mbid(name: str, user_agent: str, retries: int = 3, delay: floa
     return None
 
 
+def open_cache(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS mbid_cache(norm TEXT PRIMARY KEY, mbid TEXT, ts INTEGER)"
+        )
+    return conn
+
+
+def lookup_artist_mbid(name: str, cache: Optional[sqlite3.Connection], **search_kwargs) -> Optional[str]:
+    # Names resolved in earlier runs are served from the cache without
+    # touching the network (or the rate limiter); only hits are stored so
+    # that unresolved names are retried next time.
+    norm = normalize_name(name)
+    if cache is not None:
+        row = cache.execute("SELECT mbid FROM mbid_cache WHERE norm=?", (norm,)).fetchone()
+        if row:
+            return row[0]
+
+    mbid = search_artist_mbid(name, **search_kwargs)
+    if cache is not None and mbid is not None:
+        with cache:
+            cache.execute(
+                "INSERT OR REPLACE INTO mbid_cache(norm, mbid, ts) VALUES (?, ?, ?)",
+                (norm, mbid, int(time.time())),
+            )
+    return mbid
+
+
 def read_names(path: str):
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
@@ -117,12 +368,12 @@ def read_names(path: str):
 
 def write_artists_json(mbids: List[str], output_path: str):
     # Match the example format: one compact object per line with two-space indent
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write("[\n")
-        for i, mbid in enumerate(mbids):
-            comma = "," if i < len(mbids) - 1 else ""
-            f.write(f'  {{ "MusicBrainzId": "{mbid}" }}{comma}\n')
-        f.write("]\n")
+    lines = [f'  {{ "MusicBrainzId": "{mbid}" }}' for mbid in mbids]
+    body = ",\n".join(lines) + "\n" if lines else ""
+    payload = f"[\n{body}]\n".encode("utf-8")
+    # Build the document in memory and hand it to the OS in one write
+    with open(output_path, "wb") as f:
+        f.write(payload)
 
 
 def main():
@@ -136,13 +387,23 @@ def main():
         default=DEFAULT_USER_AGENT,
         help=f"User-Agent for MusicBrainz (default: {DEFAULT_USER_AGENT})",
     )
-    parser.add_argument("--delay", type=float, default=1.1, help="Delay between requests in seconds")
+    parser.add_argument("--delay", type=float, default=1.1, help="Minimum interval between requests in seconds")
     parser.add_argument("--retries", type=int, default=3, help="Retry attempts for transient errors")
     parser.add_argument(
         "--strict",
         action="store_true",
         help="Exit with error if any artist cannot be resolved",
     )
+    parser.add_argument(
+        "--cache-db",
+        default=DEFAULT_CACHE_DB,
+        help=f"SQLite file caching resolved MusicBrainz IDs (default: {DEFAULT_CACHE_DB})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always query MusicBrainz; do not read or write the cache",
+    )
 
     args = parser.parse_args()
 
@@ -152,20 +413,44 @@ def main():
         write_artists_json([], args.output)
         return
 
+    # Respect MusicBrainz 1 req/sec guideline; the interval grows while the
+    # server throttles us and shrinks back to --delay once it recovers.
+    limiter = RateLimiter(max_requests=1, period=args.delay)
+    cache = None if args.no_cache else open_cache(args.cache_db)
+
+    # Look each distinct name up only once: case/whitespace variants share
+    # a normalized key. Lookups run in a stable, sorted order.
+    unique: Dict[str, str] = {}
+    for name in names:
+        unique.setdefault(normalize_name(name), name)
+
+    resolved: Dict[str, Optional[str]] = {}
+    try:
+        for norm, name in sorted(unique.items()):
+            mbid = lookup_artist_mbid(
+                name,
+                cache,
+                user_agent=args.user_agent,
+                retries=args.retries,
+                delay=args.delay,
+                limiter=limiter,
+            )
+            if mbid is None:
+                sys.stderr.write(f"Warning: No MusicBrainz ID found for '{name}'\n")
+                if args.strict:
+                    sys.exit(f"Failed to resolve artist: {name}")
+            resolved[norm] = mbid
+    finally:
+        if cache is not None:
+            cache.close()
+
+    # Emit results in input order.
     mbids: List[str] = []
-    for idx, name in enumerate(names):
-        mbid = search_artist_mbid(name, user_agent=args.user_agent, retries=args.retries, delay=args.delay)
-        if mbid is None:
-            sys.stderr.write(f"Warning: No MusicBrainz ID found for '{name}'\n")
-            if args.strict:
-                sys.exit(f"Failed to resolve artist: {name}")
-        else:
+    for name in names:
+        mbid = resolved[normalize_name(name)]
+        if mbid is not None:
             mbids.append(mbid)
 
-        # Respect MusicBrainz 1 req/sec guideline
-        if idx < len(names) - 1:
-            time.sleep(args.delay)
-
     write_artists_json(mbids, args.output)
 
 
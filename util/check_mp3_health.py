@@ -5,11 +5,23 @@ Scan a directory tree for MP3 files and verify them with ffmpeg.
 Each file is probed with:
     ffmpeg -v error -xerror -i <file> -f null -
 
+To amortise ffmpeg's start-up cost, files are checked in batches: a single
+ffmpeg process decodes every file of the batch (one input and one null output
+per file). If the batch fails, each of its files is re-checked on its own so
+the error is attributed to the right path.
+
+If PyAV (https://pyav.org) is installed, files are decoded in-process through
+libavformat/libavcodec instead, which avoids spawning ffmpeg altogether; pass
+--backend ffmpeg to force the subprocess checks. PyAV checks one file per task,
+so --batch-size only applies to the ffmpeg backend.
+
 Any file that makes ffmpeg exit with a non-zero status is reported on stdout as a
 single line containing the file path and the first error message emitted by
-ffmpeg. Files are probed in parallel worker threads for better throughput. The
-script exits with code 0 even if corrupt files are encountered so that callers
-can decide how to react.
+ffmpeg. Batches are probed in parallel worker threads for better throughput;
+the directory walk is streamed into a bounded window of in-flight checks, so
+results are reported as soon as each batch finishes. The script exits with
+code 0 even if corrupt files are encountered so that callers can decide how
+to react.
 """
 
 from __future__ import annotations
@@ -18,38 +30,53 @@ import argparse
 import os
 import subprocess
 import sys
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Sequence
 
+try:
+    import av
+except ImportError:  # PyAV is optional; fall back to the ffmpeg executable.
+    av = None
 
-def iter_mp3_files(root: Path) -> Iterable[Path]:
-    """Yield every .mp3 file under root recursively."""
-    for dirpath, _, filenames in os.walk(root):
-        base = Path(dirpath)
-        for name in filenames:
-            if name.lower().endswith(".mp3"):
-                yield base / name
 
+def iter_mp3_files(root: Path) -> Iterable[str]:
+    """
+    Yield the path of every .mp3 file under root recursively.
 
-def run_ffmpeg_check(ffmpeg: str, path: Path) -> tuple[int, str]:
+    Uses os.scandir directly so directory entries' cached file types are used
+    instead of a stat() per entry; paths stay plain strings.
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue  # unreadable directory; os.walk skipped these too
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name[-4:].lower() == ".mp3" and entry.is_file():
+                    yield entry.path
+
+
+def run_ffmpeg_check(ffmpeg: str, paths: Sequence[str]) -> tuple[int, str]:
     """
-    Run ffmpeg against path and return (return_code, first_error_line).
+    Run one ffmpeg over every file in paths and return (return_code, first_error_line).
 
     If ffmpeg exits with 0, the error line will be an empty string.
     """
-    cmd = [
-        ffmpeg,
-        "-v",
-        "error",
-        "-xerror",
-        "-i",
-        str(path),
-        "-f",
-        "null",
-        "-",
-    ]
+    cmd = [ffmpeg, "-v", "error", "-xerror"]
+    for path in paths:
+        cmd += ["-i", path]
+    if len(paths) == 1:
+        cmd += ["-f", "null", "-"]
+    else:
+        # Mirror the single-file default stream selection for every input.
+        for index in range(len(paths)):
+            cmd += ["-map", f"{index}:a:0", "-map", f"{index}:v:0?", "-f", "null", "-"]
+
     result = subprocess.run(
         cmd,
         stdout=subprocess.PIPE,
@@ -68,10 +95,38 @@ def run_ffmpeg_check(ffmpeg: str, path: Path) -> tuple[int, str]:
     return result.returncode, f"ffmpeg exited with status {result.returncode}"
 
 
-def perform_check(ffmpeg: str, path: Path) -> tuple[Path, int, str]:
-    """Return (path, return_code, error_line) for a single file."""
-    return_code, error_line = run_ffmpeg_check(ffmpeg, path)
-    return path, return_code, error_line
+def run_pyav_check(path: str) -> tuple[int, str]:
+    """
+    Decode path's first audio stream in-process with PyAV.
+
+    Returns (return_code, error_message) like run_ffmpeg_check; PyAV releases
+    the GIL inside libav, so worker threads decode in parallel.
+    """
+    av_error = getattr(av, "FFmpegError", None) or av.AVError
+    try:
+        with av.open(path) as container:
+            for packet in container.demux(audio=0):
+                packet.decode()
+    except (av_error, OSError, IndexError) as exc:
+        return 1, str(exc) or type(exc).__name__
+    return 0, ""
+
+
+def perform_check(backend: str, ffmpeg: str, paths: Sequence[str]) -> list[tuple[str, int, str]]:
+    """Return (path, return_code, error_line) for every file in paths."""
+    if backend == "pyav":
+        return [(path, *run_pyav_check(path)) for path in paths]
+
+    return_code, error_line = run_ffmpeg_check(ffmpeg, paths)
+    if return_code == 0 or len(paths) == 1:
+        return [(path, return_code, error_line) for path in paths]
+
+    # Something in the batch is broken; find out which file(s).
+    results = []
+    for path in paths:
+        return_code, error_line = run_ffmpeg_check(ffmpeg, [path])
+        results.append((path, return_code, error_line))
+    return results
 
 
 def main(argv: list[str] | None = None) -> int:
@@ -88,6 +143,15 @@ def main(argv: list[str] | None = None) -> int:
         default="ffmpeg",
         help="ffmpeg executable to use (default: %(default)s).",
     )
+    parser.add_argument(
+        "--backend",
+        choices=("auto", "pyav", "ffmpeg"),
+        default="auto",
+        help=(
+            "Decode in-process with PyAV or by running ffmpeg; 'auto' uses PyAV "
+            "when it is installed (default: %(default)s)."
+        ),
+    )
     parser.add_argument(
         "--quiet",
         action="store_true",
@@ -103,6 +167,15 @@ def main(argv: list[str] | None = None) -> int:
             "Setting this too high may overwhelm your system."
         ),
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help=(
+            "Number of files decoded by each ffmpeg process (default: %(default)s). "
+            "Ignored by the PyAV backend, which checks one file per task."
+        ),
+    )
 
     args = parser.parse_args(argv)
     root = args.root
@@ -113,23 +186,56 @@ def main(argv: list[str] | None = None) -> int:
         parser.error(f"root path is not a directory: {root}")
     if args.workers < 1:
         parser.error("--workers must be >= 1")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be >= 1")
+    if args.backend == "pyav" and av is None:
+        parser.error("--backend pyav requires PyAV (pip install av)")
+    backend = args.backend
+    if backend == "auto":
+        backend = "pyav" if av is not None else "ffmpeg"
+    # Batching only amortises ffmpeg start-up; PyAV has none, so give each
+    # file its own task and let the workers decode in parallel.
+    batch_size = 1 if backend == "pyav" else args.batch_size
 
     total_checked = 0
     total_bad = 0
-    mp3_files = list(iter_mp3_files(root))
-    check_func = partial(perform_check, args.ffmpeg)
-
-    try:
-        with ThreadPoolExecutor(max_workers=args.workers) as executor:
-            for mp3_path, return_code, error_line in executor.map(
-                check_func, mp3_files
-            ):
+    # Keep at most two batches queued per worker so the walk never runs far
+    # ahead of ffmpeg and memory stays flat on very large trees.
+    max_in_flight = args.workers * 2
+
+    def report(done: set[Future[list[tuple[str, int, str]]]]) -> None:
+        nonlocal total_checked, total_bad
+        for future in done:
+            for mp3_path, return_code, error_line in future.result():
                 total_checked += 1
                 if return_code != 0:
                     total_bad += 1
                     print(f"[BAD] {mp3_path}: {error_line}")
                 elif not args.quiet:
                     print(f"[OK ] {mp3_path}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            pending: set[Future[list[tuple[str, int, str]]]] = set()
+
+            def submit(batch: list[str]) -> None:
+                nonlocal pending
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    report(done)
+                pending.add(executor.submit(perform_check, backend, args.ffmpeg, batch))
+
+            batch: list[str] = []
+            for mp3_path in iter_mp3_files(root):
+                batch.append(mp3_path)
+                if len(batch) >= batch_size:
+                    submit(batch)
+                    batch = []
+            if batch:
+                submit(batch)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                report(done)
     except KeyboardInterrupt:
         print("Interrupted by user.", file=sys.stderr)
         return 130
@@ -3,8 +3,11 @@
 from __future__ import annotations
 
 import argparse
+import os
 import subprocess
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 
@@ -27,44 +30,103 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Remove each original lossless file after a successful conversion.",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Number of files to encode in parallel (default: {DEFAULT_JOBS}).",
+    )
+    parser.add_argument(
+        "--lame-quality",
+        type=int,
+        choices=range(10),
+        metavar="0-9",
+        help="LAME algorithm quality: 0 is best but slowest, 9 fastest (default: LAME's own default).",
+    )
     return parser.parse_args()
 
 
 SUPPORTED_EXTENSIONS = {".flac", ".m4a", ".wav"}
 
+# libmp3lame encodes each file on a single core; use half the CPUs to leave
+# headroom for decoding and disk I/O.
+DEFAULT_JOBS = max(1, (os.cpu_count() or 1) // 2)
+
+# Serialises output from worker threads so lines do not interleave.
+_PRINT_LOCK = threading.Lock()
 
-def iter_lossless_files(root: Path):
-    for path in root.rglob("*"):
-        if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS:
-            yield path
 
+def log(message: str, error: bool = False) -> None:
+    with _PRINT_LOCK:
+        print(message, file=sys.stderr if error else sys.stdout)
 
-def convert_source(source_path: Path, dry_run: bool = False) -> bool:
+
+def iter_lossless_files(root: Path):
+    # Walk with os.scandir so the entries' cached file types are used instead
+    # of a stat() per entry; only matching files become Path objects.
+    stack = [os.fspath(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS and entry.is_file():
+                    yield Path(entry.path)
+
+
+def convert_source(source_path: Path, dry_run: bool = False, lame_quality: int | None = None) -> bool:
     mp3_path = source_path.with_suffix(".mp3")
     cmd = [
         "ffmpeg",
         "-y",
+        # Two decoder threads per job; with the default --jobs this keeps
+        # every core busy without oversubscribing.
+        "-threads",
+        "2",
         "-i",
         str(source_path),
+        # Only the first audio stream is needed; cover art, subtitle and
+        # data streams are dropped instead of being processed.
+        "-map",
+        "0:a:0",
         "-vn",
+        "-sn",
+        "-dn",
         "-codec:a",
         "libmp3lame",
         "-b:a",
         "320k",
-        str(mp3_path),
     ]
+    if lame_quality is not None:
+        cmd += ["-compression_level", str(lame_quality)]
+    cmd.append(str(mp3_path))
     if dry_run:
-        print(f"[dry-run] Would encode '{source_path}' -> '{mp3_path}'")
+        log(f"[dry-run] Would encode '{source_path}' -> '{mp3_path}'")
         return True
 
-    print(f"Encoding '{source_path}' -> '{mp3_path}'")
+    log(f"Encoding '{source_path}' -> '{mp3_path}'")
     try:
-        result = subprocess.run(cmd, check=True)
+        # Capture ffmpeg's output: with several encodes running at once its
+        # progress lines would otherwise be interleaved on the terminal.
+        result = subprocess.run(
+            cmd,
+            check=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
     except FileNotFoundError:
-        print("Error: ffmpeg not found. Ensure ffmpeg is installed and on PATH.", file=sys.stderr)
+        log("Error: ffmpeg not found. Ensure ffmpeg is installed and on PATH.", error=True)
         return False
     except subprocess.CalledProcessError as exc:
-        print(f"ffmpeg failed for '{source_path}' with exit code {exc.returncode}.", file=sys.stderr)
+        details = (exc.stderr or "").strip().splitlines()
+        reason = f": {details[-1]}" if details else ""
+        log(f"ffmpeg failed for '{source_path}' with exit code {exc.returncode}{reason}", error=True)
         return False
 
     return result.returncode == 0
@@ -72,16 +134,16 @@ def convert_source(source_path: Path, dry_run: bool = False) -> bool:
 
 def remove_original(source_path: Path, dry_run: bool = False) -> bool:
     if dry_run:
-        print(f"[dry-run] Would remove '{source_path}'")
+        log(f"[dry-run] Would remove '{source_path}'")
         return True
 
     try:
         source_path.unlink()
     except OSError as exc:
-        print(f"Failed to remove '{source_path}': {exc}", file=sys.stderr)
+        log(f"Failed to remove '{source_path}': {exc}", error=True)
         return False
 
-    print(f"Removed '{source_path}'")
+    log(f"Removed '{source_path}'")
     return True
 
 
@@ -97,22 +159,47 @@ def main() -> None:
         print(f"Error: '{root}' is not a directory.", file=sys.stderr)
         sys.exit(1)
 
+    if args.jobs < 1:
+        print("Error: --jobs must be >= 1.", file=sys.stderr)
+        sys.exit(1)
+
     source_files = list(iter_lossless_files(root))
     if not source_files:
         print("No FLAC, WAV, or lossless M4A files found; nothing to do.")
         return
 
+    # Sources sharing a stem (song.flac, song.wav) would all be encoded to
+    # the same song.mp3 concurrently; refuse those instead of guessing.
+    by_output: dict[Path, list[Path]] = {}
+    for source_file in source_files:
+        by_output.setdefault(source_file.with_suffix(".mp3"), []).append(source_file)
+
     failed = 0
-    total = len(source_files)
-    for index, source_file in enumerate(source_files, start=1):
-        converted_ok = convert_source(source_file, dry_run=args.dry_run)
-        if not converted_ok:
-            failed += 1
-        elif args.remove_original and not remove_original(source_file, dry_run=args.dry_run):
-            failed += 1
-
-        percent_complete = (index / total) * 100
-        print(f"{index}/{total} files processed ({percent_complete:.1f}%)")
+    to_convert: list[Path] = []
+    for mp3_path, sources in by_output.items():
+        if len(sources) == 1:
+            to_convert.append(sources[0])
+            continue
+        names = ", ".join(f"'{source}'" for source in sources)
+        log(f"Skipping {names}: they would all be encoded to '{mp3_path}'.", error=True)
+        failed += len(sources)
+
+    total = len(to_convert)
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(convert_source, source_file, args.dry_run, args.lame_quality): source_file
+            for source_file in to_convert
+        }
+        for index, future in enumerate(as_completed(futures), start=1):
+            source_file = futures[future]
+            converted_ok = future.result()
+            if not converted_ok:
+                failed += 1
+            elif args.remove_original and not remove_original(source_file, dry_run=args.dry_run):
+                failed += 1
+
+            percent_complete = (index / total) * 100
+            log(f"{index}/{total} files processed ({percent_complete:.1f}%)")
 
     if failed:
         print(f"Completed with {failed} failure(s).", file=sys.stderr)
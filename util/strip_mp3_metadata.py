@@ -4,73 +4,141 @@ strip_mp3_metadata.py
 Remove ID3 metadata from MP3 files.
 
 Usage:
-  python3 strip_mp3_metadata.py [-r] [--dry-run] [PATH]
+  python3 strip_mp3_metadata.py [-r] [--dry-run] [-j N] [PATH]
 
 Options:
   -r, --recursive  Walk directories recursively.
   --dry-run        Report what would be stripped without writing changes.
+  -j, --jobs N     Number of files to process in parallel.
 """
 
 import argparse
+import mmap
 import os
+import shutil
 import stat
 import sys
 import tempfile
-from typing import Iterator, Tuple
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Iterator, Optional, Set, Tuple
+
+DEFAULT_JOBS = min(8, os.cpu_count() or 1)
 
 
 def synchsafe_to_int(data: bytes) -> int:
     """Convert a 4-byte synchsafe integer to a regular int."""
-    value = 0
-    for byte in data:
-        value = (value << 7) | (byte & 0x7F)
-    return value
+    return (
+        (data[0] & 0x7F) << 21
+        | (data[1] & 0x7F) << 14
+        | (data[2] & 0x7F) << 7
+        | (data[3] & 0x7F)
+    )
 
 
-def detect_id3v2(path: str) -> Tuple[bool, int]:
-    """Return (has_tag, total_tag_size) for an ID3v2 header."""
-    with open(path, "rb") as fh:
-        header = fh.read(10)
-        if len(header) < 10 or header[:3] != b"ID3":
-            return False, 0
+def read_at(fd: int, size: int, offset: int) -> bytes:
+    """Read up to size bytes at offset without moving the file position."""
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
 
-        flags = header[5]
-        tag_body_size = synchsafe_to_int(header[6:10])
-        tag_size = tag_body_size + 10
-        if flags & 0x10:  # footer present
-            tag_size += 10
 
-        fh.seek(0, os.SEEK_END)
-        if tag_size >= fh.tell():
-            return False, 0  # corrupt tag; do nothing
-        return True, tag_size
+def detect_tags(fd: int, size: int) -> Tuple[bool, int, bool]:
+    """
+    Return (has_v2, v2_size, has_v1) for the open file fd of the given size.
 
+    Both ends of the file are inspected through the same descriptor: the
+    ID3v2 header at offset 0 and the ID3v1 marker 128 bytes from the end.
+    Files too short to hold an ID3v1 tag skip the second read entirely.
+    """
+    header = read_at(fd, 10, 0)
+    tail = read_at(fd, 3, size - 128) if size >= 128 else b""
 
-def detect_id3v1(path: str) -> bool:
-    """Return True if an ID3v1 tag is present at the end of the file."""
-    try:
-        with open(path, "rb") as fh:
-            fh.seek(-128, os.SEEK_END)
-            return fh.read(3) == b"TAG"
-    except OSError:
-        return False
+    has_v1 = tail == b"TAG"
+    tag_size = id3v2_tag_size(header, size)
+    return tag_size > 0, tag_size, has_v1
+
+
+def id3v2_tag_size(header: bytes, size: int) -> int:
+    """Return the total ID3v2 tag size given the first 10 bytes, or 0 if none."""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+
+    flags = header[5]
+    tag_body_size = synchsafe_to_int(header[6:10])
+    tag_size = tag_body_size + 10
+    if flags & 0x10:  # footer present
+        tag_size += 10
+
+    if tag_size >= size:
+        return 0  # corrupt tag; do nothing
+    return tag_size
+
+
+def copy_range(src, dst, offset: int, count: int) -> None:
+    """Copy count bytes of src starting at offset to dst's current position."""
+    if hasattr(os, "sendfile"):
+        try:
+            # Let the kernel move the data page cache to page cache.
+            while count > 0:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset, count)
+                if sent == 0:
+                    return
+                offset += sent
+                count -= sent
+            return
+        except OSError:
+            pass  # not supported for this file pair; finish in userspace
+
+    src.seek(offset)
+    shutil.copyfileobj(src, dst, 4 * 1024 * 1024)
 
 
 def strip_id3v2(path: str, tag_size: int) -> None:
     """Remove the ID3v2 segment at the start of the file."""
+    with open(path, "r+b") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        # The shift below cannot be undone, so confirm the tag detected
+        # earlier is still exactly what this descriptor sees.
+        if id3v2_tag_size(fh.read(10), size) != tag_size:
+            raise ValueError("ID3v2 tag changed since detection; file left untouched")
+        try:
+            mm = mmap.mmap(fh.fileno(), size)
+        except (OSError, ValueError):
+            mm = None  # e.g. filesystems without mmap support
+        if mm is not None:
+            # Shift the audio over the tag in place (a memmove on the page
+            # cache) and cut off the tail: half the writes of a full copy,
+            # and the inode and hard links are preserved.
+            with mm:
+                mm.move(0, tag_size, size - tag_size)
+                mm.flush()
+            fh.truncate(size - tag_size)
+            return
+
+    strip_id3v2_copy(path, tag_size)
+
+
+def strip_id3v2_copy(path: str, tag_size: int) -> None:
+    """Remove the ID3v2 segment by copying the rest of the file to a new one."""
     tmp_path = None
     try:
         with open(path, "rb") as src:
-            src.seek(tag_size)
+            size = os.fstat(src.fileno()).st_size - tag_size
             with tempfile.NamedTemporaryFile(
                 "wb", delete=False, dir=os.path.dirname(path) or "."
             ) as tmp:
                 tmp_path = tmp.name
-                while True:
-                    chunk = src.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    tmp.write(chunk)
+                if hasattr(os, "posix_fallocate") and size > 0:
+                    try:
+                        os.posix_fallocate(tmp.fileno(), 0, size)
+                    except OSError:
+                        pass  # preallocation is only an optimisation
+                copy_range(src, tmp, tag_size, size)
+                tmp.flush()
+                # Drop any preallocated tail if the source shrank meanwhile.
+                tmp.truncate(os.lseek(tmp.fileno(), 0, os.SEEK_CUR))
         os.replace(tmp_path, path)
         tmp_path = None
     finally:
@@ -82,33 +150,47 @@ def strip_id3v1(path: str) -> None:
     """Remove ID3v1 footer by truncating the last 128 bytes."""
     with open(path, "r+b") as fh:
         fh.seek(0, os.SEEK_END)
-        if fh.tell() >= 128:
-            fh.truncate(fh.tell() - 128)
+        size = fh.tell()
+        if size < 128:
+            raise ValueError("ID3v1 tag no longer present; file left untouched")
+        fh.seek(size - 128)
+        if fh.read(3) != b"TAG":
+            raise ValueError("ID3v1 tag no longer present; file left untouched")
+        fh.truncate(size - 128)
 
 
 def iter_mp3s(root: str, recursive: bool) -> Iterator[str]:
     """Yield MP3 file paths under root."""
-    if recursive:
-        for current, _, filenames in os.walk(root):
-            for name in filenames:
-                if name.lower().endswith(".mp3"):
-                    full = os.path.join(current, name)
-                    if os.path.isfile(full):
-                        yield full
-    else:
-        for name in os.listdir(root):
-            if name.lower().endswith(".mp3"):
-                full = os.path.join(root, name)
-                if os.path.isfile(full):
-                    yield full
-
-
-def process_file(path: str, has_v2: bool, v2_size: int, has_v1: bool) -> bool:
+    # os.scandir exposes each entry's file type from the directory listing,
+    # so only symlinks need an extra stat() to tell files from directories.
+    stack = [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                elif entry.name[-4:].lower() == ".mp3" and entry.is_file():
+                    yield entry.path
+
+
+def process_file(
+    path: str,
+    has_v2: bool,
+    v2_size: int,
+    has_v1: bool,
+    stat_result: Optional[os.stat_result] = None,
+) -> bool:
     """Strip any detected tags and restore original times/permissions."""
     if not (has_v2 or has_v1):
         return False
 
-    stat_result = os.stat(path, follow_symlinks=False)
+    if stat_result is None:
+        stat_result = os.stat(path)
     mode = stat.S_IMODE(stat_result.st_mode)
 
     if has_v2:
@@ -121,6 +203,41 @@ def process_file(path: str, has_v2: bool, v2_size: int, has_v1: bool) -> bool:
     return True
 
 
+def handle_mp3(path: str, dry_run: bool) -> Tuple[str, str]:
+    """
+    Detect and (unless dry_run) strip the tags of one file.
+
+    Returns (outcome, message) where outcome is "ok" when tags were removed,
+    "skip" when the file could not be read or rewritten, and "" otherwise.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            stat_result = os.fstat(fd)
+            has_v2, v2_size, has_v1 = detect_tags(fd, stat_result.st_size)
+        finally:
+            os.close(fd)
+    except OSError as exc:
+        return "skip", f"[skip] {path}: {exc}"
+
+    if dry_run:
+        if has_v2 or has_v1:
+            tags = []
+            if has_v2:
+                tags.append("ID3v2")
+            if has_v1:
+                tags.append("ID3v1")
+            return "", f"[dry-run] would remove {' + '.join(tags)}: {path}"
+        return "", ""
+
+    try:
+        if process_file(path, has_v2, v2_size, has_v1, stat_result):
+            return "ok", f"[ok] stripped metadata: {path}"
+    except Exception as exc:  # noqa: BLE001
+        return "skip", f"[error] {path}: {exc}"
+    return "", ""
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="Remove metadata from MP3 files.")
     parser.add_argument(
@@ -140,47 +257,68 @@ def main() -> int:
         action="store_true",
         help="Report what would change without modifying files.",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Number of files to process in parallel (default: {DEFAULT_JOBS}).",
+    )
     args = parser.parse_args()
 
+    if args.jobs < 1:
+        print("--jobs must be >= 1", file=sys.stderr)
+        return 1
+
     target = os.path.abspath(args.path)
     if not os.path.isdir(target):
         print(f"Not a directory: {target}", file=sys.stderr)
         return 1
 
-    mp3_paths = list(iter_mp3s(target, args.recursive))
-    if not mp3_paths:
-        print("No MP3 files found.")
-        return 0
-
     processed = 0
     skipped = 0
 
-    for mp3_path in mp3_paths:
-        try:
-            has_v2, v2_size = detect_id3v2(mp3_path)
-            has_v1 = detect_id3v1(mp3_path)
-        except OSError as exc:
-            skipped += 1
-            print(f"[skip] {mp3_path}: {exc}", file=sys.stderr)
-            continue
-
-        if args.dry_run:
-            if has_v2 or has_v1:
-                tags = []
-                if has_v2:
-                    tags.append("ID3v2")
-                if has_v1:
-                    tags.append("ID3v1")
-                print(f"[dry-run] would remove {' + '.join(tags)}: {mp3_path}")
-            continue
-
-        try:
-            if process_file(mp3_path, has_v2, v2_size, has_v1):
-                processed += 1
-                print(f"[ok] stripped metadata: {mp3_path}")
-        except Exception as exc:  # noqa: BLE001
+    def report(outcome: str, message: str) -> None:
+        nonlocal processed, skipped
+        if outcome == "ok":
+            processed += 1
+            print(message)
+        elif outcome == "skip":
             skipped += 1
-            print(f"[error] {mp3_path}: {exc}", file=sys.stderr)
+            print(message, file=sys.stderr)
+        elif message:
+            print(message)
+
+    # Paths are streamed from the directory walk into a bounded window of
+    # in-flight jobs, so traversal overlaps with tag I/O. Workers only do the
+    # file I/O; results are printed here, in input order, so output lines
+    # never interleave.
+    any_seen = False
+    seen_files: Set[Tuple[int, int]] = set()
+    pending: Deque["Future[Tuple[str, str]]"] = deque()
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        for mp3_path in iter_mp3s(target, args.recursive):
+            any_seen = True
+            # Hard links and symlinks give one file several paths; tags are
+            # stripped in place, so each file must reach a worker only once.
+            try:
+                st = os.stat(mp3_path)
+            except OSError:
+                pass  # handle_mp3 reports the error
+            else:
+                file_id = (st.st_dev, st.st_ino)
+                if file_id in seen_files:
+                    continue
+                seen_files.add(file_id)
+            pending.append(executor.submit(handle_mp3, mp3_path, args.dry_run))
+            if len(pending) > args.jobs * 2:
+                report(*pending.popleft().result())
+        while pending:
+            report(*pending.popleft().result())
+
+    if not any_seen:
+        print("No MP3 files found.")
+        return 0
 
     if not args.dry_run:
         print(f"Done. Updated {processed} file(s); skipped {skipped}.")